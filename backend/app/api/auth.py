@@ -1,14 +1,21 @@
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+import numpy as np
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only, make_transient_to_detached
 
 from app.database import get_db
 from app.models.stock_holding import StockHolding
@@ -24,12 +31,41 @@ if not SECRET_KEY:
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: argon2id primary (better throughput at equivalent security),
+# bcrypt kept for existing hashes with an env-tunable cost factor
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+    bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", "10")),
+    bcrypt__ident="2b"
+)
+
+# Initialize the hash backends at import time so the first login/register
+# after boot doesn't pay passlib's lazy-init cost inside a request handler
+if os.getenv("PASSWORD_BACKEND_WARMUP", "1") == "1":
+    pwd_context.hash("warmup")
 
 # Security
 security = HTTPBearer()
 
+# Cache of token-hash -> (user column values, token exp). Lets hot authenticated
+# endpoints skip both the JWT decode and the user SELECT; entries are dropped
+# when the token itself expires and via invalidate_user. TTLCache is not
+# thread-safe and gets hit from both the threadpool (sync dependencies) and
+# the event loop, so every access goes through the lock.
+_user_cache_lock = threading.Lock()
+_user_cache: TTLCache = TTLCache(maxsize=10000, ttl=60)
+
+def invalidate_user(user_id: int) -> None:
+    """Drop cached authentications for a user after auth-relevant changes"""
+    with _user_cache_lock:
+        for key, (values, _) in list(_user_cache.items()):
+            if values["id"] == user_id:
+                _user_cache.pop(key, None)
+
 # Pydantic schemas
 class UserRegister(BaseModel):
     email: EmailStr
@@ -42,49 +78,130 @@ class UserLogin(BaseModel):
     password: str
 
 class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     email: str
     username: str
     full_name: str
     is_active: bool
 
-    class Config:
-        from_attributes = True
-
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
 
 class StockHoldingResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     symbol: str
     quantity: Decimal
     average_cost: Decimal
-    current_price: Decimal | None = None
-    market_value: Decimal | None = None
-    gain_loss: Decimal | None = None
-    gain_loss_percentage: Decimal | None = None
-
-    class Config:
-        from_attributes = True
+    # Computed valuations are floats: they are derived in float64 anyway and
+    # serialize as JSON numbers without Pydantic's per-field Decimal encoding
+    current_price: float | None = None
+    market_value: float | None = None
+    gain_loss: float | None = None
+    gain_loss_percentage: float | None = None
 
 class PortfolioResponse(BaseModel):
     cash_balance: Decimal
     holdings: list[StockHoldingResponse]
-    total_market_value: Decimal
-    total_gain_loss: Decimal
-    total_gain_loss_percentage: Decimal
+    total_market_value: float
+    total_gain_loss: float
+    total_gain_loss_percentage: float
     number_of_holdings: int
 
 class PerformanceResponse(BaseModel):
-    total_value: Decimal
+    total_value: float
     cash_balance: Decimal
-    holdings_value: Decimal
-    total_gain_loss: Decimal
-    total_gain_loss_percentage: Decimal
+    holdings_value: float
+    total_gain_loss: float
+    total_gain_loss_percentage: float
     number_of_holdings: int
 
+def fetch_quotes(symbols: set[str]) -> dict[str, dict | None]:
+    """Fetch quotes for a set of symbols in one batched download"""
+    return stock_service.get_stock_quotes_batch(sorted(symbols))
+
+def to_money(value: float) -> float:
+    """Round a computed value to two decimal places for API responses"""
+    return round(value, 2)
+
+def compute_holding_values(
+    holdings: list[StockHolding],
+    quotes: dict[str, dict | None]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Compute per-holding price, market value, cost basis and gain/loss arrays
+
+    Works in float64 across all holdings in one vectorized pass; callers
+    convert to Decimal only at the response boundary.
+    """
+    count = len(holdings)
+
+    def resolve_price(holding: StockHolding) -> float:
+        quote = quotes.get(holding.symbol)
+        if quote and quote.get("price"):
+            return float(quote["price"])
+        return float(holding.average_cost)
+
+    quantity = np.fromiter((float(h.quantity) for h in holdings), dtype=np.float64, count=count)
+    avg_cost = np.fromiter((float(h.average_cost) for h in holdings), dtype=np.float64, count=count)
+    price = np.fromiter((resolve_price(h) for h in holdings), dtype=np.float64, count=count)
+
+    market_value = quantity * price
+    cost_basis = quantity * avg_cost
+    gain_loss = market_value - cost_basis
+    safe_cost = np.where(cost_basis > 0, cost_basis, 1.0)
+    gain_loss_pct = np.where(cost_basis > 0, gain_loss / safe_cost * 100, 0.0)
+
+    return price, market_value, cost_basis, gain_loss, gain_loss_pct
+
+@dataclass
+class PortfolioSnapshot:
+    """Holdings with their current valuation, shared by /portfolio and /performance"""
+    holdings: list[StockHolding]
+    price: np.ndarray
+    market_value: np.ndarray
+    cost_basis: np.ndarray
+    gain_loss: np.ndarray
+    gain_loss_percentage: np.ndarray
+
+    @property
+    def holdings_value(self) -> float:
+        return float(self.market_value.sum())
+
+    @property
+    def total_cost(self) -> float:
+        return float(self.cost_basis.sum())
+
+def compute_portfolio_snapshot(current_user: User, db: Session) -> PortfolioSnapshot:
+    """Fetch a user's holdings, price them in one batch and value the portfolio
+
+    Quotes are fetched once per unique symbol and reattributed to rows, so
+    duplicate holding rows (ruled out going forward by the (user_id, symbol)
+    unique constraint, but possible in pre-constraint data) never trigger
+    repeat price lookups.
+    """
+    holdings = db.query(StockHolding).options(
+        load_only(StockHolding.id, StockHolding.symbol, StockHolding.quantity, StockHolding.average_cost)
+    ).filter(
+        StockHolding.user_id == current_user.id
+    ).all()
+
+    quotes = fetch_quotes({holding.symbol for holding in holdings})
+    price, market_value, cost_basis, gain_loss, gain_loss_pct = compute_holding_values(holdings, quotes)
+
+    return PortfolioSnapshot(
+        holdings=holdings,
+        price=price,
+        market_value=market_value,
+        cost_basis=cost_basis,
+        gain_loss=gain_loss,
+        gain_loss_percentage=gain_loss_pct
+    )
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -101,6 +218,28 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> int:
+    """Get the authenticated user's id from the JWT, without touching the DB
+
+    Read-only endpoints that only filter by user_id should depend on this
+    instead of get_current_user, which loads (or reattaches) the user row.
+    """
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id: int | None = payload.get("user_id")
+    except JWTError:
+        user_id = None
+
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -112,42 +251,42 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+    token = credentials.credentials
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+    with _user_cache_lock:
+        cached = _user_cache.get(cache_key)
+    if cached is not None:
+        values, exp = cached
+        if exp is None or exp > time.time():
+            # Rebuild the row and attach it to this session without a SELECT
+            user = User(**values)
+            make_transient_to_detached(user)
+            return db.merge(user, load=False)
+        with _user_cache_lock:
+            _user_cache.pop(cache_key, None)
+
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        user_id: int = payload.get("user_id")
+        if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
+    user = db.get(User, user_id)
     if user is None:
         raise credentials_exception
 
+    values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+    with _user_cache_lock:
+        _user_cache[cache_key] = (values, payload.get("exp"))
+
     return user
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def register(user_data: UserRegister, db: Session = Depends(get_db)):
     """Register a new user"""
-    # Check if user already exists
-    existing_user = db.query(User).filter(
-        (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
-
-    if existing_user:
-        if existing_user.email == user_data.email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already taken"
-            )
-
-    # Create new user
+    # Create new user; the unique constraints on email/username catch duplicates
     hashed_password = get_password_hash(user_data.password)
     new_user = User(
         email=user_data.email,
@@ -161,12 +300,26 @@ def register(user_data: UserRegister, db: Session = Depends(get_db)):
         db.commit()
         db.refresh(new_user)
         return new_user
-    except IntegrityError:
+    except IntegrityError as e:
         db.rollback()
+        # Classify by the violated constraint's name; matching on the message
+        # text would also scan the DETAIL line, which embeds user-supplied
+        # values (a username containing "email" would misclassify)
+        constraint = getattr(getattr(e.orig, "diag", None), "constraint_name", None)
+        if constraint == "users_email_key":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            ) from None
+        if constraint == "users_username_key":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already taken"
+            ) from None
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User registration failed"
-        )
+        ) from None
 
 @router.post("/login", response_model=Token)
 def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
@@ -175,6 +328,9 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == user_credentials.email).first()
 
     if not user:
+        # Burn a hash verification anyway so unknown emails take as long as
+        # wrong passwords (no timing oracle for valid accounts)
+        pwd_context.dummy_verify()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -189,6 +345,11 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Lazily migrate hashes made with an older scheme/cost to the current one
+    if pwd_context.needs_update(user.hashed_password):
+        user.hashed_password = get_password_hash(user_credentials.password)
+        db.commit()
+
     # Check if user is active
     if not user.is_active:
         raise HTTPException(
@@ -215,92 +376,61 @@ def get_user_profile(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.get("/portfolio", response_model=PortfolioResponse)
-def get_user_portfolio(
+async def get_user_portfolio(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get user's portfolio with holdings and analytics"""
-    # Get holdings
-    holdings = db.query(StockHolding).filter(
-        StockHolding.user_id == current_user.id
-    ).all()
-
-    # Calculate performance metrics
-    holdings_response = []
-    total_market_value = Decimal("0.00")
-    total_cost = Decimal("0.00")
-
-    for holding in holdings:
-        # Fetch real-time price from stock service
-        quote = stock_service.get_stock_quote(holding.symbol)
-        current_price = Decimal(str(quote["price"])) if quote and quote.get("price") else holding.average_cost
+    # Offload the blocking DB fetch + quote download so the event loop stays free
+    snapshot = await asyncio.to_thread(compute_portfolio_snapshot, current_user, db)
 
-        market_value = holding.quantity * current_price
-        cost_basis = holding.quantity * holding.average_cost
-        gain_loss = market_value - cost_basis
-        gain_loss_percentage = (gain_loss / cost_basis * 100) if cost_basis > 0 else Decimal("0.00")
-
-        holdings_response.append(StockHoldingResponse(
+    holdings_response = [
+        StockHoldingResponse(
             id=holding.id,
             symbol=holding.symbol,
             quantity=holding.quantity,
             average_cost=holding.average_cost,
-            current_price=current_price,
-            market_value=market_value,
-            gain_loss=gain_loss,
-            gain_loss_percentage=gain_loss_percentage
-        ))
-
-        total_market_value += market_value
-        total_cost += cost_basis
+            current_price=to_money(snapshot.price[i]),
+            market_value=to_money(snapshot.market_value[i]),
+            gain_loss=to_money(snapshot.gain_loss[i]),
+            gain_loss_percentage=to_money(snapshot.gain_loss_percentage[i])
+        )
+        for i, holding in enumerate(snapshot.holdings)
+    ]
 
+    total_market_value = snapshot.holdings_value
+    total_cost = snapshot.total_cost
     total_gain_loss = total_market_value - total_cost
-    total_gain_loss_percentage = (total_gain_loss / total_cost * 100) if total_cost > 0 else Decimal("0.00")
+    total_gain_loss_percentage = (total_gain_loss / total_cost * 100) if total_cost > 0 else 0.0
 
     return PortfolioResponse(
         cash_balance=current_user.cash_balance,
         holdings=holdings_response,
-        total_market_value=total_market_value,
-        total_gain_loss=total_gain_loss,
-        total_gain_loss_percentage=total_gain_loss_percentage,
-        number_of_holdings=len(holdings)
+        total_market_value=to_money(total_market_value),
+        total_gain_loss=to_money(total_gain_loss),
+        total_gain_loss_percentage=to_money(total_gain_loss_percentage),
+        number_of_holdings=len(snapshot.holdings)
     )
 
 @router.get("/performance", response_model=PerformanceResponse)
-def get_user_performance(
+async def get_user_performance(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get user's portfolio performance metrics (total value, gains/losses, etc.)"""
-    # Get all holdings
-    holdings = db.query(StockHolding).filter(
-        StockHolding.user_id == current_user.id
-    ).all()
-
-    # Calculate performance
-    holdings_value = Decimal("0.00")
-    total_cost = Decimal("0.00")
-
-    for holding in holdings:
-        # Fetch real-time price from stock service
-        quote = stock_service.get_stock_quote(holding.symbol)
-        current_price = Decimal(str(quote["price"])) if quote and quote.get("price") else holding.average_cost
-
-        market_value = holding.quantity * current_price
-        cost_basis = holding.quantity * holding.average_cost
-
-        holdings_value += market_value
-        total_cost += cost_basis
+    # Offload the blocking DB fetch + quote download so the event loop stays free
+    snapshot = await asyncio.to_thread(compute_portfolio_snapshot, current_user, db)
 
-    total_value = current_user.cash_balance + holdings_value
+    holdings_value = snapshot.holdings_value
+    total_cost = snapshot.total_cost
     total_gain_loss = holdings_value - total_cost
-    total_gain_loss_percentage = (total_gain_loss / total_cost * 100) if total_cost > 0 else Decimal("0.00")
+    total_gain_loss_percentage = (total_gain_loss / total_cost * 100) if total_cost > 0 else 0.0
 
     return PerformanceResponse(
-        total_value=total_value,
+        total_value=to_money(float(current_user.cash_balance) + holdings_value),
         cash_balance=current_user.cash_balance,
-        holdings_value=holdings_value,
-        total_gain_loss=total_gain_loss,
-        total_gain_loss_percentage=total_gain_loss_percentage,
-        number_of_holdings=len(holdings)
+        holdings_value=to_money(holdings_value),
+        total_gain_loss=to_money(total_gain_loss),
+        total_gain_loss_percentage=to_money(total_gain_loss_percentage),
+        number_of_holdings=len(snapshot.holdings)
     )
@@ -1,54 +1,110 @@
 from datetime import datetime
 from decimal import Decimal
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, validator
-from sqlalchemy.orm import Session
-
-from app.api.auth import get_current_user
-from app.database import get_db
+import msgspec
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from sqlalchemy import bindparam, delete, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.auth import get_current_user, get_current_user_id, invalidate_user
+from app.database import get_async_db
 from app.models.stock_holding import StockHolding
 from app.models.transaction import Transaction, TransactionType
 from app.models.user import User
+from app.services.transaction_batcher import cash_batcher
 
 router = APIRouter()
 
+
 # Pydantic schemas
 class TransactionCreate(BaseModel):
     transaction_type: TransactionType
     symbol: str | None = None
-    quantity: Decimal | None = None
-    price: Decimal | None = None
+    # Positivity is enforced per-field in Pydantic's Rust core; the model
+    # validator below only checks presence for stock transactions
+    quantity: Decimal | None = Field(default=None, gt=0)
+    price: Decimal | None = Field(default=None, gt=0)
     total_amount: Decimal
     fees: Decimal | None = Decimal("0.00")
     notes: str | None = None
     transaction_date: datetime | None = None
 
-    @validator('symbol')
-    def validate_symbol(cls, v, values):
-        """Validate that symbol is provided for stock transactions"""
-        if values.get('transaction_type') in [TransactionType.BUY, TransactionType.SELL]:
-            if not v:
-                raise ValueError('Symbol is required for BUY/SELL transactions')
-        return v
-
-    @validator('quantity')
-    def validate_quantity(cls, v, values):
-        """Validate that quantity is provided for stock transactions"""
-        if values.get('transaction_type') in [TransactionType.BUY, TransactionType.SELL]:
-            if not v or v <= 0:
-                raise ValueError('Quantity must be greater than 0 for BUY/SELL transactions')
-        return v
-
-    @validator('price')
-    def validate_price(cls, v, values):
-        """Validate that price is provided for stock transactions"""
-        if values.get('transaction_type') in [TransactionType.BUY, TransactionType.SELL]:
-            if not v or v <= 0:
-                raise ValueError('Price must be greater than 0 for BUY/SELL transactions')
-        return v
+    @field_validator("symbol", mode="after")
+    @classmethod
+    def uppercase_symbol(cls, v: str | None) -> str | None:
+        """Normalize once on ingress so handlers never re-uppercase"""
+        return v.upper() if v else v
+
+    @model_validator(mode="after")
+    def validate_stock_fields(self):
+        """Validate that symbol, quantity and price are provided for stock transactions"""
+        match self.transaction_type:
+            case TransactionType.BUY | TransactionType.SELL:
+                if not self.symbol:
+                    raise ValueError('Symbol is required for BUY/SELL transactions')
+                if self.quantity is None:
+                    raise ValueError('Quantity must be greater than 0 for BUY/SELL transactions')
+                if self.price is None:
+                    raise ValueError('Price must be greater than 0 for BUY/SELL transactions')
+        return self
+
+class TransactionOut(msgspec.Struct, gc=False):
+    """Read-path shape of a transaction row, encoded directly by msgspec
+
+    Bypasses Pydantic validation entirely on the list endpoint; the rows come
+    straight from typed DB columns, so re-validating them buys nothing.
+    """
+    id: int
+    user_id: int
+    transaction_type: str
+    symbol: str | None
+    quantity: Decimal | None
+    price: Decimal | None
+    total_amount: Decimal
+    fees: Decimal
+    notes: str | None
+    transaction_date: datetime
+    created_at: datetime
+
+# Column tuple matching TransactionOut's field order
+_TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.user_id,
+    Transaction.transaction_type,
+    Transaction.symbol,
+    Transaction.quantity,
+    Transaction.price,
+    Transaction.total_amount,
+    Transaction.fees,
+    Transaction.notes,
+    Transaction.transaction_date,
+    Transaction.created_at,
+)
+
+# Statements built once at import: the select() construction and its compile
+# cache key are paid at module load, leaving only parameter binding per call
+_TRANSACTIONS_LIST_Q = (
+    select(*_TRANSACTION_COLUMNS)
+    .where(Transaction.user_id == bindparam("uid"))
+    .order_by(Transaction.id.desc())
+    .limit(bindparam("limit"))
+)
+
+# Keyset variant: id < before_id walks the same index without OFFSET's scan
+_TRANSACTIONS_LIST_BEFORE_Q = _TRANSACTIONS_LIST_Q.where(
+    Transaction.id < bindparam("before_id")
+)
 
 class TransactionResponse(BaseModel):
+    """Full-validation schema for single-transaction responses
+
+    Rendered through the app-wide ORJSONResponse default; Decimal fields
+    serialize as strings, matching the msgspec encoding on the list endpoint.
+    """
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     user_id: int
     transaction_type: TransactionType
@@ -61,212 +117,260 @@ class TransactionResponse(BaseModel):
     transaction_date: datetime
     created_at: datetime
 
-    class Config:
-        from_attributes = True
-
 @router.post("/", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
-def create_transaction(
+async def create_transaction(
     transaction_data: TransactionCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new transaction (BUY/SELL/DEPOSIT/WITHDRAWAL)"""
-    # Create transaction
-    new_transaction = Transaction(
-        user_id=current_user.id,
-        transaction_type=transaction_data.transaction_type,
-        symbol=transaction_data.symbol.upper() if transaction_data.symbol else None,
-        quantity=transaction_data.quantity,
-        price=transaction_data.price,
-        total_amount=transaction_data.total_amount,
-        fees=transaction_data.fees,
-        notes=transaction_data.notes,
-        transaction_date=transaction_data.transaction_date or datetime.utcnow()
-    )
-
-    # Update user based on transaction type
+    symbol = transaction_data.symbol
+
+    # Column values for the INSERT below; transaction_date is omitted when
+    # absent so the column's server_default=func.now() fills it in the DB
+    tx_values = {
+        "user_id": current_user.id,
+        "transaction_type": transaction_data.transaction_type,
+        "symbol": symbol,
+        "quantity": transaction_data.quantity,
+        "price": transaction_data.price,
+        "total_amount": transaction_data.total_amount,
+        "fees": transaction_data.fees,
+        "notes": transaction_data.notes,
+    }
+    if transaction_data.transaction_date is not None:
+        tx_values["transaction_date"] = transaction_data.transaction_date
+
+    # Update user based on transaction type. All balance changes happen as
+    # conditional UPDATEs in the DB: the funds predicate makes overdrafting
+    # impossible under concurrent requests, with no SELECT ... FOR UPDATE
     if transaction_data.transaction_type == TransactionType.BUY:
         # Deduct cash for purchase
         total_cost = transaction_data.total_amount + transaction_data.fees
-        if current_user.cash_balance < total_cost:
+        debited = (await db.execute(
+            update(User)
+            .where(User.id == current_user.id, User.cash_balance >= total_cost)
+            .values(cash_balance=User.cash_balance - total_cost)
+            .returning(User.cash_balance)
+        )).first()
+        if debited is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Insufficient cash balance"
             )
-        current_user.cash_balance -= total_cost
-
-        # Update or create stock holding
-        holding = db.query(StockHolding).filter(
-            StockHolding.user_id == current_user.id,
-            StockHolding.symbol == transaction_data.symbol.upper()
-        ).first()
-
-        if holding:
-            # Update existing holding (calculate new average cost)
-            total_cost_basis = (holding.quantity * holding.average_cost) + transaction_data.total_amount
-            holding.quantity += transaction_data.quantity
-            holding.average_cost = total_cost_basis / holding.quantity
-        else:
-            # Create new holding
-            new_holding = StockHolding(
+
+        # Upsert the holding in one atomic statement; the new average cost is
+        # recomputed server-side, so there is no SELECT + UPDATE race window
+        quantity = transaction_data.quantity
+        await db.execute(
+            pg_insert(StockHolding).values(
                 user_id=current_user.id,
-                symbol=transaction_data.symbol.upper(),
-                quantity=transaction_data.quantity,
+                symbol=symbol,
+                quantity=quantity,
                 average_cost=transaction_data.price
+            ).on_conflict_do_update(
+                index_elements=["user_id", "symbol"],
+                set_={
+                    "quantity": StockHolding.quantity + quantity,
+                    "average_cost": (
+                        (StockHolding.quantity * StockHolding.average_cost + transaction_data.total_amount)
+                        / (StockHolding.quantity + quantity)
+                    )
+                }
             )
-            db.add(new_holding)
+        )
 
     elif transaction_data.transaction_type == TransactionType.SELL:
-        # Check if holding exists and has sufficient quantity
-        holding = db.query(StockHolding).filter(
-            StockHolding.user_id == current_user.id,
-            StockHolding.symbol == transaction_data.symbol.upper()
-        ).first()
-
-        if not holding:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"No holdings found for {transaction_data.symbol}"
+        # Conditional decrement: the quantity predicate rules out overselling
+        # atomically, without a read-modify-write race
+        quantity = transaction_data.quantity
+        sold = (await db.execute(
+            update(StockHolding)
+            .where(
+                StockHolding.user_id == current_user.id,
+                StockHolding.symbol == symbol,
+                StockHolding.quantity >= quantity
             )
-
-        if holding.quantity < transaction_data.quantity:
+            .values(quantity=StockHolding.quantity - quantity)
+            .returning(StockHolding.id, StockHolding.quantity)
+        )).first()
+
+        if sold is None:
+            # Failure path only: probe the holding to pick the right error
+            held = (await db.execute(
+                select(StockHolding.quantity).where(
+                    StockHolding.user_id == current_user.id,
+                    StockHolding.symbol == symbol
+                )
+            )).scalar_one_or_none()
+            if held is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"No holdings found for {symbol}"
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient shares. You have {holding.quantity}, trying to sell {transaction_data.quantity}"
+                detail=f"Insufficient shares. You have {held}, trying to sell {quantity}"
             )
 
+        if sold.quantity == 0:
+            # Position fully closed
+            await db.execute(delete(StockHolding).where(StockHolding.id == sold.id))
+
         # Add cash from sale
         total_proceeds = transaction_data.total_amount - transaction_data.fees
-        current_user.cash_balance += total_proceeds
-
-        # Update holding
-        holding.quantity -= transaction_data.quantity
-        if holding.quantity == 0:
-            db.delete(holding)
+        await db.execute(
+            update(User)
+            .where(User.id == current_user.id)
+            .values(cash_balance=User.cash_balance + total_proceeds)
+        )
 
     elif transaction_data.transaction_type == TransactionType.DEPOSIT:
         # Add cash to user
-        current_user.cash_balance += transaction_data.total_amount
+        await db.execute(
+            update(User)
+            .where(User.id == current_user.id)
+            .values(cash_balance=User.cash_balance + transaction_data.total_amount)
+        )
 
     elif transaction_data.transaction_type == TransactionType.WITHDRAWAL:
         # Deduct cash from user
-        if current_user.cash_balance < transaction_data.total_amount:
+        debited = (await db.execute(
+            update(User)
+            .where(
+                User.id == current_user.id,
+                User.cash_balance >= transaction_data.total_amount
+            )
+            .values(cash_balance=User.cash_balance - transaction_data.total_amount)
+            .returning(User.cash_balance)
+        )).first()
+        if debited is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Insufficient cash balance for withdrawal"
             )
-        current_user.cash_balance -= transaction_data.total_amount
 
-    db.add(new_transaction)
-    db.commit()
-    db.refresh(new_transaction)
+    if transaction_data.transaction_type in (TransactionType.DEPOSIT, TransactionType.WITHDRAWAL):
+        # Cash-only rows have no holding side effects: commit the balance
+        # change here, then hand the row to the write-behind batcher, which
+        # coalesces it with neighbouring cash transactions into one INSERT
+        await db.commit()
+        try:
+            new_transaction = await cash_batcher.submit(tx_values)
+        except Exception:
+            # The balance change above is already committed but its ledger
+            # row was never written; back the balance out so the two can't
+            # desynchronize, then surface the failure
+            delta = (
+                transaction_data.total_amount
+                if transaction_data.transaction_type == TransactionType.WITHDRAWAL
+                else -transaction_data.total_amount
+            )
+            await db.execute(
+                update(User)
+                .where(User.id == current_user.id)
+                .values(cash_balance=User.cash_balance + delta)
+            )
+            await db.commit()
+            invalidate_user(current_user.id)
+            raise
+    else:
+        # INSERT ... RETURNING reads back the server-filled defaults in the
+        # same round trip, replacing the commit-then-refresh SELECT
+        new_transaction = (await db.execute(
+            insert(Transaction).values(**tx_values).returning(Transaction)
+        )).scalar_one()
+        await db.commit()
+
+    # Cached authentications hold the pre-transaction cash balance
+    invalidate_user(current_user.id)
 
     return new_transaction
 
-@router.get("/", response_model=list[TransactionResponse])
-def get_transactions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/")
+async def get_transactions(
+    limit: int = Query(50, ge=1, le=500),
+    before_id: int | None = None,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all transactions for user"""
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == current_user.id
-    ).order_by(Transaction.transaction_date.desc()).all()
-
-    return transactions
+    """Get the user's transactions, newest first; pass before_id to page back"""
+    # Core column tuples instead of ORM objects: no per-row identity-map
+    # bookkeeping, and msgspec encodes the structs without re-validation
+    if before_id is None:
+        rows = (await db.execute(
+            _TRANSACTIONS_LIST_Q, {"uid": current_user_id, "limit": limit}
+        )).all()
+    else:
+        rows = (await db.execute(
+            _TRANSACTIONS_LIST_BEFORE_Q,
+            {"uid": current_user_id, "limit": limit, "before_id": before_id}
+        )).all()
+
+    return Response(
+        content=msgspec.json.encode([TransactionOut(*row) for row in rows]),
+        media_type="application/json"
+    )
 
-@router.get("/{transaction_id}", response_model=TransactionResponse)
-def get_transaction(
+@router.get("/{transaction_id}")
+async def get_transaction(
     transaction_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific transaction details"""
-    transaction = db.query(Transaction).filter(
-        Transaction.id == transaction_id,
-        Transaction.user_id == current_user.id
-    ).first()
+    # Primary-key get consults the identity map before emitting SQL; the
+    # ownership check moves into Python (same 404 either way)
+    transaction = await db.get(Transaction, transaction_id)
 
-    if not transaction:
+    if transaction is None or transaction.user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Transaction not found"
         )
 
-    return transaction
+    # model_construct skips Pydantic validation (and the response_model
+    # re-validation pass). Safe here because every value comes straight from
+    # a typed column that matches the schema field exactly.
+    return TransactionResponse.model_construct(
+        id=transaction.id,
+        user_id=transaction.user_id,
+        transaction_type=transaction.transaction_type,
+        symbol=transaction.symbol,
+        quantity=transaction.quantity,
+        price=transaction.price,
+        total_amount=transaction.total_amount,
+        fees=transaction.fees,
+        notes=transaction.notes,
+        transaction_date=transaction.transaction_date,
+        created_at=transaction.created_at
+    )
 
 @router.delete("/{transaction_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_transaction(
+async def delete_transaction(
     transaction_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Delete a transaction (will recalculate user holdings)"""
-    transaction = db.query(Transaction).filter(
-        Transaction.id == transaction_id,
-        Transaction.user_id == current_user.id
-    ).first()
-
-    if not transaction:
+    """Delete a transaction, reversing its cash and holding effects"""
+    # The whole reversal runs server-side in one round trip; see
+    # reverse_transaction in database/schema.sql. FALSE means the row does
+    # not exist or belongs to another user.
+    reversed_ok = (await db.execute(
+        text("SELECT reverse_transaction(:tx_id, :uid)"),
+        {"tx_id": transaction_id, "uid": current_user.id}
+    )).scalar_one()
+
+    if not reversed_ok:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Transaction not found"
         )
 
-    # Reverse the transaction effects
-    if transaction.transaction_type == TransactionType.BUY:
-        # Refund cash
-        total_cost = transaction.total_amount + transaction.fees
-        current_user.cash_balance += total_cost
-
-        # Update holding
-        holding = db.query(StockHolding).filter(
-            StockHolding.user_id == current_user.id,
-            StockHolding.symbol == transaction.symbol
-        ).first()
-
-        if holding:
-            if holding.quantity <= transaction.quantity:
-                db.delete(holding)
-            else:
-                # Recalculate average cost
-                total_cost_basis = (holding.quantity * holding.average_cost) - transaction.total_amount
-                holding.quantity -= transaction.quantity
-                holding.average_cost = total_cost_basis / holding.quantity if holding.quantity > 0 else Decimal("0.00")
-
-    elif transaction.transaction_type == TransactionType.SELL:
-        # Deduct cash
-        total_proceeds = transaction.total_amount - transaction.fees
-        current_user.cash_balance -= total_proceeds
-
-        # Restore holding
-        holding = db.query(StockHolding).filter(
-            StockHolding.user_id == current_user.id,
-            StockHolding.symbol == transaction.symbol
-        ).first()
-
-        if holding:
-            # Add shares back
-            total_cost_basis = holding.quantity * holding.average_cost
-            holding.quantity += transaction.quantity
-            holding.average_cost = total_cost_basis / holding.quantity
-        else:
-            # Recreate holding (Note: we don't know the original cost basis, so we use transaction price)
-            new_holding = StockHolding(
-                user_id=current_user.id,
-                symbol=transaction.symbol,
-                quantity=transaction.quantity,
-                average_cost=transaction.price
-            )
-            db.add(new_holding)
-
-    elif transaction.transaction_type == TransactionType.DEPOSIT:
-        current_user.cash_balance -= transaction.total_amount
-
-    elif transaction.transaction_type == TransactionType.WITHDRAWAL:
-        current_user.cash_balance += transaction.total_amount
+    await db.commit()
 
-    db.delete(transaction)
-    db.commit()
+    # Cached authentications hold the pre-reversal cash balance
+    invalidate_user(current_user.id)
 
     return None
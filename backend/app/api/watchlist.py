@@ -3,6 +3,7 @@ from decimal import Decimal
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.api.auth import get_current_user
@@ -40,17 +41,6 @@ def add_to_watchlist(
     """Add a stock to the user's watchlist"""
     symbol = watchlist_data.symbol.upper()
 
-    existing = db.query(Watchlist).filter(
-        Watchlist.user_id == current_user.id,
-        Watchlist.symbol == symbol
-    ).first()
-
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"{symbol} is already in your watchlist"
-        )
-
     new_item = Watchlist(
         user_id=current_user.id,
         symbol=symbol,
@@ -58,8 +48,17 @@ def add_to_watchlist(
         notes=watchlist_data.notes
     )
 
-    db.add(new_item)
-    db.commit()
+    # The (user_id, symbol) unique constraint catches duplicates, so the happy
+    # path is a single INSERT round-trip with no existence pre-check
+    try:
+        db.add(new_item)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{symbol} is already in your watchlist"
+        ) from None
     db.refresh(new_item)
 
     return new_item
@@ -1,5 +1,8 @@
+import asyncio
 import json
+from collections import defaultdict
 
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 router = APIRouter()
@@ -9,32 +12,54 @@ class ConnectionManager:
 
     def __init__(self):
         self.active_connections: list[WebSocket] = []
-        self.subscriptions: dict = {}  # {websocket: [symbols]}
+        self.subscriptions: dict[WebSocket, set[str]] = {}  # {websocket: {symbols}}
+        self.by_symbol: dict[str, set[WebSocket]] = defaultdict(set)  # reverse index
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
-        self.subscriptions[websocket] = []
+        self.subscriptions[websocket] = set()
 
     def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
-        if websocket in self.subscriptions:
-            del self.subscriptions[websocket]
+        for symbol in self.subscriptions.pop(websocket, ()):
+            self._unindex(symbol, websocket)
+
+    def _unindex(self, symbol: str, websocket: WebSocket):
+        subscribers = self.by_symbol.get(symbol)
+        if subscribers:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.by_symbol[symbol]
 
     async def subscribe(self, websocket: WebSocket, symbols: list[str]):
         """Subscribe to stock price updates"""
-        if websocket in self.subscriptions:
-            self.subscriptions[websocket] = symbols
+        if websocket not in self.subscriptions:
+            return
+        old_symbols = self.subscriptions[websocket]
+        new_symbols = set(symbols)
+        for symbol in old_symbols - new_symbols:
+            self._unindex(symbol, websocket)
+        for symbol in new_symbols - old_symbols:
+            self.by_symbol[symbol].add(websocket)
+        self.subscriptions[websocket] = new_symbols
 
     async def broadcast_price_update(self, symbol: str, data: dict):
         """Send price update to all subscribers of a symbol"""
-        for websocket, symbols in self.subscriptions.items():
-            if symbol in symbols:
-                await websocket.send_json({
-                    "type": "price_update",
-                    "symbol": symbol,
-                    "data": data
-                })
+        subscribers = self.by_symbol.get(symbol)
+        if not subscribers:
+            return
+        # Serialize once per tick instead of once per subscriber
+        payload = orjson.dumps({
+            "type": "price_update",
+            "symbol": symbol,
+            "data": data
+        }).decode()
+        # gather so one slow socket doesn't serialize the fan-out
+        await asyncio.gather(
+            *(websocket.send_text(payload) for websocket in subscribers),
+            return_exceptions=True
+        )
 
 manager = ConnectionManager()
 
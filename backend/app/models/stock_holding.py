@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric, String, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -18,7 +18,8 @@ class StockHolding(Base):
     # Relationships
     user = relationship("User", back_populates="holdings")
 
-    # Composite unique constraint: one holding per symbol per user
+    # One holding per symbol per user (matches the UNIQUE in schema.sql);
+    # the backing btree also covers lookups by (user_id, symbol)
     __table_args__ = (
-        {"schema": None},
+        UniqueConstraint("user_id", "symbol", name="uq_holding_user_symbol"),
     )
@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, Numeric, String
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, Numeric, String
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -18,8 +18,10 @@ class Transaction(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    transaction_type = Column(Enum(TransactionType), nullable=False)
-    symbol = Column(String, index=True)  # Stock symbol (null for DEPOSIT/WITHDRAWAL)
+    # VARCHAR + CHECK instead of a native PG enum: skips the per-row enum
+    # type lookup in the DBAPI layer while keeping the Python-enum interface
+    transaction_type = Column(Enum(TransactionType, native_enum=False, length=16), nullable=False)
+    symbol = Column(String)  # Stock symbol (null for DEPOSIT/WITHDRAWAL)
     quantity = Column(Numeric(15, 4))  # Number of shares
     price = Column(Numeric(15, 2))  # Price per share
     total_amount = Column(Numeric(15, 2), nullable=False)  # Total transaction amount
@@ -30,3 +32,20 @@ class Transaction(Base):
 
     # Relationships
     user = relationship("User", back_populates="transactions")
+
+    # Covering index for the listing query: (user_id, id DESC) matches its
+    # WHERE + keyset ORDER BY, and the INCLUDE payload carries the fixed-size
+    # selected columns. notes is deliberately absent: unbounded TEXT can blow
+    # the ~2.7KB btree tuple limit and fail the INSERT, so the scan fetches
+    # it from the heap instead.
+    __table_args__ = (
+        Index(
+            "ix_tx_user_listing",
+            "user_id",
+            id.desc(),
+            postgresql_include=[
+                "transaction_type", "symbol", "quantity", "price",
+                "total_amount", "fees", "transaction_date", "created_at",
+            ],
+        ),
+    )
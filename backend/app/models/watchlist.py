@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric, String, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -17,3 +17,8 @@ class Watchlist(Base):
 
     # Relationships
     user = relationship("User", back_populates="watchlists")
+
+    # Prevent duplicate symbols per user (matches the UNIQUE in schema.sql)
+    __table_args__ = (
+        UniqueConstraint("user_id", "symbol", name="uq_watchlist_user_symbol"),
+    )
@@ -1,15 +1,45 @@
+import logging
 import os
+import threading
 from datetime import datetime
 
 import requests
 import yfinance as yf
+from cachetools import TTLCache
+from curl_cffi import requests as curl_requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 ALPHA_VANTAGE_BASE_URL = "https://www.alphavantage.co/query"
 
+# Shared session so repeated Yahoo/Alpha Vantage calls reuse pooled TCP+TLS
+# connections instead of handshaking per request
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+
+# Shared curl_cffi session for yfinance tickers: reuses the TLS connection,
+# cookies and crumb across calls instead of re-establishing them per ticker
+_yf_session = curl_requests.Session(impersonate="chrome")
+
+# In-process caches: quotes go stale within seconds, company info and history
+# are comparatively static. Failed quote lookups are cached briefly so a dead
+# symbol doesn't trigger an upstream round-trip on every request.
+_cache_lock = threading.Lock()
+_quote_cache: TTLCache = TTLCache(maxsize=4096, ttl=15)
+_quote_miss_cache: TTLCache = TTLCache(maxsize=1024, ttl=5)
+_info_cache: TTLCache = TTLCache(maxsize=2048, ttl=600)
+_hist_cache: TTLCache = TTLCache(maxsize=2048, ttl=300)
+
 
 class StockService:
     """Service for fetching stock data from Alpha Vantage and yfinance"""
@@ -28,7 +58,7 @@ class StockService:
                 "quotesQueryId": "tss_match_phrase_query"
             }
             headers = {"User-Agent": "Mozilla/5.0"}
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = _session.get(url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
             data = response.json()
 
@@ -46,15 +76,109 @@ class StockService:
                 })
             return results
         except Exception as e:
-            print(f"Yahoo Finance search error: {e}")
+            logger.warning("Yahoo Finance search error: %s", e)
             return []
 
     @staticmethod
     def get_stock_quote(symbol: str) -> dict | None:
-        """Get real-time quote for a stock using yfinance (primary) and Alpha Vantage (backup)"""
+        """Get real-time quote for a stock, served from a short-lived in-process cache"""
+        key = symbol.upper()
+        with _cache_lock:
+            if key in _quote_cache:
+                return _quote_cache[key]
+            if key in _quote_miss_cache:
+                return None
+
+        quote = StockService._fetch_stock_quote(symbol)
+
+        with _cache_lock:
+            if quote is not None:
+                _quote_cache[key] = quote
+            else:
+                _quote_miss_cache[key] = True
+        return quote
+
+    @staticmethod
+    def get_stock_quotes_batch(symbols: list[str]) -> dict[str, dict | None]:
+        """Get lightweight quotes (price, previous close) for many symbols in one download
+
+        Collapses the N per-symbol HTTP round-trips into a single batched
+        yf.download call. Symbols with a fresh cached quote are served from the
+        cache; anything the batch download misses falls back to the per-symbol
+        path (which has its own Alpha Vantage fallback and negative cache).
+        """
+        symbols = [s.upper() for s in symbols]
+        if not symbols:
+            return {}
+
+        quotes: dict[str, dict | None] = {}
+        with _cache_lock:
+            for symbol in symbols:
+                if symbol in _quote_cache:
+                    quotes[symbol] = _quote_cache[symbol]
+        pending = [s for s in symbols if s not in quotes]
+        if not pending:
+            return quotes
+
+        data = None
+        try:
+            data = yf.download(
+                tickers=" ".join(pending),
+                period="2d",
+                group_by="ticker",
+                threads=True,
+                progress=False
+            )
+        except Exception as e:
+            logger.warning("yfinance batch download error: %s", e)
+
+        for symbol in pending:
+            quote = None
+            if data is not None and not data.empty:
+                try:
+                    frame = data[symbol] if len(pending) > 1 else data
+                    closes = frame["Close"].dropna()
+                    price = float(closes.iloc[-1])
+                    previous_close = float(closes.iloc[-2]) if len(closes) > 1 else None
+                    change = price - previous_close if previous_close else None
+                    quote = {
+                        "symbol": symbol,
+                        "price": price,
+                        "change": round(change, 2) if change else None,
+                        "change_percent": round(change / previous_close * 100, 2) if change else None,
+                        "previous_close": previous_close,
+                        "timestamp": datetime.now().isoformat()
+                    }
+                except (KeyError, IndexError):
+                    quote = None
+            if quote is None:
+                # Batch download had nothing for this symbol; try the slower path
+                quote = StockService.get_stock_quote(symbol)
+            else:
+                # Cache batch-resolved quotes too, so back-to-back portfolio
+                # requests don't re-download the whole basket
+                with _cache_lock:
+                    _quote_cache[symbol] = quote
+            quotes[symbol] = quote
+        return quotes
+
+    @staticmethod
+    def invalidate(symbol: str) -> None:
+        """Drop cached data for a symbol (e.g. when a fresher price is pushed)"""
+        key = symbol.upper()
+        with _cache_lock:
+            _quote_cache.pop(key, None)
+            _quote_miss_cache.pop(key, None)
+            _info_cache.pop(key, None)
+            for hist_key in [k for k in _hist_cache if k[0] == key]:
+                _hist_cache.pop(hist_key, None)
+
+    @staticmethod
+    def _fetch_stock_quote(symbol: str) -> dict | None:
+        """Fetch a quote using yfinance (primary) and Alpha Vantage (backup)"""
         try:
             # Primary: yfinance (faster and no rate limits)
-            ticker = yf.Ticker(symbol)
+            ticker = yf.Ticker(symbol, session=_yf_session)
             info = ticker.info
 
             if not info or "symbol" not in info:
@@ -86,7 +210,7 @@ class StockService:
                 "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
-            print(f"yfinance quote error: {e}")
+            logger.warning("yfinance quote error for %s: %s", symbol, e)
             # Fallback to Alpha Vantage
             try:
                 params = {
@@ -94,7 +218,7 @@ class StockService:
                     "symbol": symbol,
                     "apikey": ALPHA_VANTAGE_API_KEY
                 }
-                response = requests.get(ALPHA_VANTAGE_BASE_URL, params=params, timeout=10)
+                response = _session.get(ALPHA_VANTAGE_BASE_URL, params=params, timeout=10)
                 response.raise_for_status()
                 data = response.json()
 
@@ -116,13 +240,28 @@ class StockService:
                         "timestamp": datetime.now().isoformat()
                     }
             except Exception as av_error:
-                print(f"Alpha Vantage quote error: {av_error}")
+                logger.warning("Alpha Vantage quote error for %s: %s", symbol, av_error)
 
             return None
 
     @staticmethod
     def get_stock_history(symbol: str, period: str = "1M") -> dict | None:
-        """Get historical price data using yfinance"""
+        """Get historical price data, served from a short-lived in-process cache"""
+        key = (symbol.upper(), period)
+        with _cache_lock:
+            if key in _hist_cache:
+                return _hist_cache[key]
+
+        history = StockService._fetch_stock_history(symbol, period)
+
+        if history is not None:
+            with _cache_lock:
+                _hist_cache[key] = history
+        return history
+
+    @staticmethod
+    def _fetch_stock_history(symbol: str, period: str = "1M") -> dict | None:
+        """Fetch historical price data using yfinance"""
         try:
             # Map period to yfinance period format
             period_map = {
@@ -136,55 +275,59 @@ class StockService:
             }
 
             yf_period = period_map.get(period, "1mo")
-            print(f"Fetching history for {symbol} with period {yf_period}")
+            logger.debug("Fetching history for %s with period %s", symbol, yf_period)
 
-            ticker = yf.Ticker(symbol)
+            ticker = yf.Ticker(symbol, session=_yf_session)
             hist = ticker.history(period=yf_period)
 
-            print(f"History data shape: {hist.shape}")
-            print(f"History empty: {hist.empty}")
-
             if hist.empty:
-                print(f"No historical data found for {symbol}")
+                logger.debug("No historical data found for %s", symbol)
                 return None
 
-            # Convert DataFrame to list of dicts
-            history_data = []
-            for date, row in hist.iterrows():
-                history_data.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "open": round(row["Open"], 2),
-                    "high": round(row["High"], 2),
-                    "low": round(row["Low"], 2),
-                    "close": round(row["Close"], 2),
-                    "volume": int(row["Volume"])
-                })
+            # Convert DataFrame to list of dicts in one vectorized pass
+            hist = hist.round({"Open": 2, "High": 2, "Low": 2, "Close": 2})
+            hist["date"] = hist.index.strftime("%Y-%m-%d")
+            hist["volume"] = hist["Volume"].astype("int64")
+            history_data = (
+                hist[["date", "Open", "High", "Low", "Close", "volume"]]
+                .rename(columns=str.lower)
+                .to_dict(orient="records")
+            )
 
-            print(f"Returning {len(history_data)} history records")
+            logger.debug("Returning %d history records for %s", len(history_data), symbol)
             return {
                 "symbol": symbol.upper(),
                 "period": period,
                 "data": history_data
             }
-        except Exception as e:
-            print(f"Error fetching historical data for {symbol}: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error fetching historical data for %s", symbol)
             return None
 
     @staticmethod
     def get_company_info(symbol: str) -> dict | None:
-        """Get company information and fundamentals using yfinance"""
+        """Get company information, served from a short-lived in-process cache"""
+        key = symbol.upper()
+        with _cache_lock:
+            if key in _info_cache:
+                return _info_cache[key]
+
+        info = StockService._fetch_company_info(symbol)
+
+        if info is not None:
+            with _cache_lock:
+                _info_cache[key] = info
+        return info
+
+    @staticmethod
+    def _fetch_company_info(symbol: str) -> dict | None:
+        """Fetch company information and fundamentals using yfinance"""
         try:
-            print(f"Fetching company info for {symbol}")
-            ticker = yf.Ticker(symbol)
+            ticker = yf.Ticker(symbol, session=_yf_session)
             info = ticker.info
 
-            print(f"Info keys: {list(info.keys())[:10] if info else 'None'}")
-            print(f"Symbol in info: {'symbol' in info if info else False}")
-
             if not info or "symbol" not in info:
-                print(f"No valid company info found for {symbol}")
+                logger.debug("No valid company info found for %s", symbol)
                 return None
 
             result = {
@@ -206,12 +349,9 @@ class StockService:
                 "avg_volume": info.get("averageVolume"),
                 "currency": info.get("currency", "USD")
             }
-            print(f"Returning company info with name: {result['name']}")
             return result
-        except Exception as e:
-            print(f"Error fetching company info for {symbol}: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error fetching company info for %s", symbol)
             return None
 
 
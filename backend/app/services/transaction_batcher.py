@@ -0,0 +1,97 @@
+"""Write-behind batching for cash-only transaction inserts
+
+DEPOSIT and WITHDRAWAL rows have no holding side effects, so their INSERTs
+can be coalesced: each request enqueues its column values together with a
+Future, and a single flusher task drains the queue on a short interval,
+writing every pending row in one executemany INSERT with one commit. Under
+bursty load that amortizes the per-row round trip and fsync across the
+whole batch; with no queued neighbours a request still flushes within one
+interval on its own.
+"""
+
+import asyncio
+import contextlib
+import logging
+
+from sqlalchemy import insert
+
+from app.database import AsyncSessionLocal
+from app.models.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Flush whatever queued within this window, or earlier once a batch fills
+FLUSH_INTERVAL = 0.01
+MAX_BATCH = 500
+
+
+class TransactionBatcher:
+    """Coalesces transaction-row inserts from many requests into one statement"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future]] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the flusher, then drain anything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+        leftovers = []
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        if leftovers:
+            await self._flush(leftovers)
+
+    async def submit(self, values: dict) -> Transaction:
+        """Enqueue one row and wait for the batched INSERT to return it"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((values, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                # Let neighbours pile up for one interval before flushing
+                await asyncio.sleep(FLUSH_INTERVAL)
+            finally:
+                # Runs on cancellation too: rows popped off the queue are
+                # invisible to stop()'s drain, and their balance UPDATEs have
+                # already committed, so they must be flushed before exiting.
+                # The shield keeps a late cancel from interrupting the write.
+                while len(batch) < MAX_BATCH and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await asyncio.shield(self._flush(batch))
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]):
+        try:
+            async with AsyncSessionLocal() as db:
+                # sort_by_parameter_order keeps returned rows aligned with the
+                # submitted values so each Future gets its own row back
+                rows = (await db.execute(
+                    insert(Transaction).returning(
+                        Transaction, sort_by_parameter_order=True
+                    ),
+                    [values for values, _ in batch],
+                )).scalars().all()
+                await db.commit()
+        except Exception as e:
+            logger.exception("Batched transaction insert failed (%d rows)", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), row in zip(batch, rows, strict=True):
+            if not future.done():
+                future.set_result(row)
+
+
+cash_batcher = TransactionBatcher()
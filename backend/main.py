@@ -1,12 +1,28 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.api import auth, stocks, transactions, watchlist, websocket
+from app.services.transaction_batcher import cash_batcher
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    cash_batcher.start()
+    yield
+    await cash_batcher.stop()
 
 app = FastAPI(
     title="Trading Portfolio Tracker API",
     description="Real-time stock portfolio tracking and analytics",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware for React frontend
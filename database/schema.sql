@@ -17,12 +17,12 @@ CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_username ON users(username);
 
 -- Transactions table
-CREATE TYPE transaction_type AS ENUM ('BUY', 'SELL', 'DEPOSIT', 'WITHDRAWAL');
-
 CREATE TABLE transactions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    transaction_type transaction_type NOT NULL,
+    -- VARCHAR + CHECK rather than a native enum type; matches the ORM model
+    transaction_type VARCHAR(16) NOT NULL
+        CHECK (transaction_type IN ('BUY', 'SELL', 'DEPOSIT', 'WITHDRAWAL')),
     symbol VARCHAR(10),  -- NULL for DEPOSIT/WITHDRAWAL
     quantity DECIMAL(15, 4),  -- Number of shares
     price DECIMAL(15, 2),  -- Price per share
@@ -33,9 +33,14 @@ CREATE TABLE transactions (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_transactions_user_id ON transactions(user_id);
-CREATE INDEX idx_transactions_symbol ON transactions(symbol);
-CREATE INDEX idx_transactions_date ON transactions(transaction_date DESC);
+-- Covering index for the per-user listing query: (user_id, id DESC) matches
+-- its WHERE + keyset ORDER BY, and the INCLUDE payload carries the fixed-size
+-- selected columns (notes stays out: unbounded TEXT can exceed the btree
+-- tuple limit and fail inserts). Its prefix also serves plain user_id
+-- lookups, so no standalone user_id/symbol/date indexes are kept.
+CREATE INDEX ix_tx_user_listing ON transactions (user_id, id DESC)
+    INCLUDE (transaction_type, symbol, quantity, price, total_amount, fees,
+             transaction_date, created_at);
 
 -- Stock holdings table (current positions)
 CREATE TABLE stock_holdings (
@@ -80,3 +85,69 @@ CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
 
 CREATE TRIGGER update_holdings_updated_at BEFORE UPDATE ON stock_holdings
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Reverses a transaction's cash/holding effects and deletes the row, all in
+-- one server-side call. Returns FALSE when the transaction does not exist or
+-- belongs to a different user.
+CREATE OR REPLACE FUNCTION reverse_transaction(p_tx_id INTEGER, p_user_id INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    tx transactions%ROWTYPE;
+    h stock_holdings%ROWTYPE;
+BEGIN
+    -- Delete first: the row lock makes concurrent reversals of the same
+    -- transaction mutually exclusive, so only the call that actually removed
+    -- the row applies the cash/holding reversal (no double refunds)
+    DELETE FROM transactions
+    WHERE id = p_tx_id AND user_id = p_user_id
+    RETURNING * INTO tx;
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+
+    IF tx.transaction_type = 'BUY' THEN
+        -- Refund cash
+        UPDATE users SET cash_balance = cash_balance + tx.total_amount + tx.fees
+        WHERE id = p_user_id;
+
+        SELECT * INTO h FROM stock_holdings
+        WHERE user_id = p_user_id AND symbol = tx.symbol;
+        IF FOUND THEN
+            IF h.quantity <= tx.quantity THEN
+                DELETE FROM stock_holdings WHERE id = h.id;
+            ELSE
+                -- Remove the shares and back out their cost basis
+                UPDATE stock_holdings
+                SET quantity = h.quantity - tx.quantity,
+                    average_cost = (h.quantity * h.average_cost - tx.total_amount)
+                                   / (h.quantity - tx.quantity)
+                WHERE id = h.id;
+            END IF;
+        END IF;
+
+    ELSIF tx.transaction_type = 'SELL' THEN
+        -- Deduct the sale proceeds
+        UPDATE users SET cash_balance = cash_balance - (tx.total_amount - tx.fees)
+        WHERE id = p_user_id;
+
+        -- Add the shares back at the existing cost basis; if the position was
+        -- closed, recreate it at the transaction price (original basis unknown)
+        INSERT INTO stock_holdings (user_id, symbol, quantity, average_cost)
+        VALUES (p_user_id, tx.symbol, tx.quantity, tx.price)
+        ON CONFLICT (user_id, symbol) DO UPDATE
+        SET average_cost = (stock_holdings.quantity * stock_holdings.average_cost)
+                           / (stock_holdings.quantity + EXCLUDED.quantity),
+            quantity = stock_holdings.quantity + EXCLUDED.quantity;
+
+    ELSIF tx.transaction_type = 'DEPOSIT' THEN
+        UPDATE users SET cash_balance = cash_balance - tx.total_amount
+        WHERE id = p_user_id;
+
+    ELSIF tx.transaction_type = 'WITHDRAWAL' THEN
+        UPDATE users SET cash_balance = cash_balance + tx.total_amount
+        WHERE id = p_user_id;
+    END IF;
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;